@@ -1,17 +1,67 @@
+import asyncio
+import functools
+import json
+import os
+from contextlib import asynccontextmanager
+
 import aiosqlite
 import unicodedata
 from typing import List, Dict, Any, Optional
 
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
 DB_FILE = "odcaf.db"
+REDIS_URL = os.environ.get("REDIS_URL")
+CACHE_TTL = 3600
+
+_redis = aioredis.from_url(REDIS_URL) if aioredis and REDIS_URL else None
+
+def redis_cached(func):
+    """Serve repeat calls from Redis when REDIS_URL is configured.
 
+    Keys carry the generation counter that ingest bumps, so a re-ingest
+    invalidates every cached result without explicit deletes.
+    """
+    if _redis is None:
+        return func
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        try:
+            gen = await _redis.get("odcaf:gen") or b"0"
+            key = "odcaf:%s:%s:%s" % (
+                gen.decode(), func.__name__,
+                json.dumps([args, kwargs], sort_keys=True, default=str),
+            )
+            hit = await _redis.get(key)
+            if hit is not None:
+                return json.loads(hit)
+        except Exception:
+            return await func(*args, **kwargs)
+        value = await func(*args, **kwargs)
+        try:
+            await _redis.setex(key, CACHE_TTL, json.dumps(value))
+        except Exception:
+            pass
+        return value
+
+    return wrapper
+
+_PUNCT_TABLE = str.maketrans({"-": " ", "'": " ", ".": " "})
+
+@functools.lru_cache(maxsize=8192)
 def normalize_text(text: str) -> str:
     if text is None:
         return ""
+    if text.isascii():
+        return " ".join(text.lower().translate(_PUNCT_TABLE).split())
     text = text.lower()
     text = unicodedata.normalize("NFD", text)
     text = "".join(c for c in text if unicodedata.category(c) != "Mn")
-    text = text.replace("-", " ").replace("'", " ").replace(".", " ")
-    return " ".join(text.split())
+    return " ".join(text.translate(_PUNCT_TABLE).split())
 
 MUSEUM_ALIASES = [
     "museum",
@@ -20,7 +70,9 @@ MUSEUM_ALIASES = [
     "art or cultural centre",
     "heritage or historic site",
     "interpretive centre",
-    "heritage centre"
+    "heritage centre",
+    "library or archives",
+    "miscellaneous"
 ]
 
 PROVINCE_MAP = {
@@ -54,195 +106,280 @@ PROVINCE_MAP = {
     "nt": "nt"
 }
 
+_MUSEUM_ALIASES_NORM = frozenset(normalize_text(x) for x in MUSEUM_ALIASES)
+
+def prefix_range(prefix: str) -> tuple:
+    """Bounds for an index range seek equivalent to ``col LIKE 'prefix%'``."""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return prefix, upper
+
 def facility_type_matches(user_type: str, db_value: str) -> bool:
     if not user_type:
         return True
     u = normalize_text(user_type)
     d = normalize_text(db_value)
-    if u == "museum" and d in [normalize_text(x) for x in MUSEUM_ALIASES]:
+    if u == "museum" and d in _MUSEUM_ALIASES_NORM:
         return True
     return u in d
 
-async def get_db_connection() -> aiosqlite.Connection:
-    conn = await aiosqlite.connect(DB_FILE)
-    conn.row_factory = aiosqlite.Row
-    return conn
+_INIT_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-64000;
+    PRAGMA mmap_size=268435456;
+"""
+
+class AsyncSQLitePool:
+    """Pool of read-only connections plus a single writer.
+
+    SQLite in WAL mode supports many concurrent readers, but aiosqlite
+    serializes all work on one thread per connection, so a handful of
+    pooled read connections lets tool calls run in parallel.
+    """
+
+    def __init__(self, db_file: str = DB_FILE, readers: int = 4):
+        self._db_file = db_file
+        self._readers = readers
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._lock = asyncio.Lock()
+
+    async def _open_connection(self, query_only: bool) -> aiosqlite.Connection:
+        # Plain tuple rows: aiosqlite.Row adds per-row wrapper cost, and the
+        # query functions only build dicts for the rows they actually return.
+        # cached_statements lets sqlite3 skip prepare on repeated SQL, which
+        # pays off now that connections live for the process lifetime.
+        conn = await aiosqlite.connect(self._db_file, cached_statements=256)
+        await conn.executescript(_INIT_PRAGMAS)
+        if query_only:
+            await conn.execute("PRAGMA query_only=1")
+        return conn
+
+    async def _ensure_readers(self) -> asyncio.Queue:
+        if self._queue is None:
+            async with self._lock:
+                if self._queue is None:
+                    queue = asyncio.Queue()
+                    for _ in range(self._readers):
+                        queue.put_nowait(await self._open_connection(query_only=True))
+                    self._queue = queue
+        return self._queue
+
+    async def warm(self) -> None:
+        """Open the reader connections so the first request doesn't pay
+        the connect + PRAGMA cost."""
+        await self._ensure_readers()
+
+    @asynccontextmanager
+    async def read(self):
+        queue = await self._ensure_readers()
+        conn = await queue.get()
+        try:
+            yield conn
+        finally:
+            queue.put_nowait(conn)
+
+    @asynccontextmanager
+    async def write(self):
+        async with self._lock:
+            if self._writer is None:
+                self._writer = await self._open_connection(query_only=False)
+        yield self._writer
+
+    async def close(self) -> None:
+        if self._queue is not None:
+            while not self._queue.empty():
+                await (self._queue.get_nowait()).close()
+            self._queue = None
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+
+pool = AsyncSQLitePool()
+
+# Results of the static enumeration calls, keyed by name and stamped with
+# the DB file's mtime so a re-ingest invalidates them.
+_cache: Dict[str, tuple] = {}
+
+async def _cached(key: str, loader):
+    stamp = os.stat(DB_FILE).st_mtime
+    hit = _cache.get(key)
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
+    value = await loader()
+    _cache[key] = (stamp, value)
+    return value
+
+async def _load_schema() -> Dict[str, str]:
+    async with pool.read() as conn:
+        rows = await conn.execute_fetchall("PRAGMA table_info(facilities)")
+    # PRAGMA table_info rows are (cid, name, type, notnull, dflt_value, pk).
+    return {row[1]: row[2] for row in rows}
 
 async def get_schema() -> Dict[str, str]:
-    conn = await get_db_connection()
-    c = await conn.cursor()
-    await c.execute("PRAGMA table_info(facilities)")
-    rows = await c.fetchall()
-    schema = {row["name"]: row["type"] for row in rows}
-    await conn.close()
-    return schema
+    return await _cached("schema", _load_schema)
+
+async def _load_cities() -> List[str]:
+    sql = """
+        SELECT DISTINCT City FROM facilities
+        WHERE City IS NOT NULL AND City <> ''
+        ORDER BY City COLLATE NOCASE
+    """
+    async with pool.read() as conn:
+        rows = await conn.execute_fetchall(sql)
+    return [row[0] for row in rows]
 
 async def list_cities() -> List[str]:
-    conn = await get_db_connection()
-    c = await conn.cursor()
-    await c.execute("SELECT DISTINCT City FROM facilities")
-    rows = await c.fetchall()
-    await conn.close()
-    return sorted([row["City"] for row in rows if row["City"]])
+    return await _cached("cities", _load_cities)
+
+async def _load_facility_types() -> List[str]:
+    sql = """
+        SELECT DISTINCT ODCAF_Facility_Type FROM facilities
+        WHERE ODCAF_Facility_Type IS NOT NULL AND ODCAF_Facility_Type <> ''
+        ORDER BY ODCAF_Facility_Type COLLATE NOCASE
+    """
+    async with pool.read() as conn:
+        rows = await conn.execute_fetchall(sql)
+    return [row[0] for row in rows]
 
 async def list_facility_types() -> List[str]:
-    conn = await get_db_connection()
-    c = await conn.cursor()
-    await c.execute("SELECT DISTINCT ODCAF_Facility_Type FROM facilities")
-    rows = await c.fetchall()
-    await conn.close()
-    return sorted([row["ODCAF_Facility_Type"] for row in rows if row["ODCAF_Facility_Type"]])
+    return await _cached("facility_types", _load_facility_types)
+
+async def _fetch_dicts(conn: aiosqlite.Connection, sql: str, params) -> List[Dict[str, Any]]:
+    async with conn.execute(sql, params) as cursor:
+        columns = [d[0] for d in cursor.description]
+        rows = await cursor.fetchall()
+    return [dict(zip(columns, row)) for row in rows]
 
+@redis_cached
 async def fetch_facility_by_id(facility_id: str) -> Optional[Dict[str, Any]]:
-    conn = await get_db_connection()
-    c = await conn.cursor()
     norm = normalize_text(facility_id)
     sql = """
         SELECT *
         FROM facilities
-        WHERE LOWER(REPLACE(REPLACE(REPLACE(Facility_Name, '-', ' '), '.', ' '), '''', ' ')) = ?
+        WHERE facility_name_norm = ?
         LIMIT 1
     """
-    await c.execute(sql, (norm,))
-    row = await c.fetchone()
-    await conn.close()
-    if row:
-        return dict(row)
-    return None
+    async with pool.read() as conn:
+        rows = await _fetch_dicts(conn, sql, (norm,))
+    return rows[0] if rows else None
 
-async def search_facilities(query_text: str, limit: int = 20) -> List[Dict[str, Any]]:
-    conn = await get_db_connection()
-    c = await conn.cursor()
+def _build_search_sql(query_text: str, limit: int) -> tuple:
+    # SQLite treats a negative LIMIT as unlimited.
+    limit = max(limit, 0)
     norm = normalize_text(query_text)
-    tokens = norm.split()
-
-    base_sql = "SELECT * FROM facilities WHERE 1=1"
-    params = []
-
-    for token in tokens:
-        like = f"%{token}%"
-        base_sql += """
-            AND (
-                LOWER(REPLACE(REPLACE(REPLACE(City, '-', ' '), '.', ' '), '''', ' ')) LIKE ?
-                OR LOWER(REPLACE(REPLACE(REPLACE(Facility_Name, '-', ' '), '.', ' '), '''', ' ')) LIKE ?
-                OR LOWER(REPLACE(REPLACE(REPLACE(ODCAF_Facility_Type, '-', ' '), '.', ' '), '''', ' ')) LIKE ?
-            )
+    # Trigram terms shorter than 3 characters can never match, and
+    # normalization splits punctuation into short fragments ("st john s"),
+    # so those tokens would turn the whole AND expression into zero hits.
+    tokens = [token for token in norm.split() if len(token) >= 3]
+
+    if tokens:
+        # The trigram tokenizer is case-insensitive and matches substrings,
+        # so each token becomes a quoted MATCH term served by the FTS index.
+        # Double quotes survive normalization and must be doubled to stay
+        # inside the quoted term instead of terminating it.
+        match_expr = " AND ".join(
+            '"%s"' % token.replace('"', '""') for token in tokens
+        )
+        sql = """
+            SELECT f.*
+            FROM facilities_fts s
+            JOIN facilities f ON f.rowid = s.rowid
+            WHERE facilities_fts MATCH ?
+            LIMIT ?
         """
-        params.extend([like, like, like])
-
-    base_sql += " LIMIT ?"
-    params.append(limit)
+        return sql, (match_expr, limit)
 
-    await c.execute(base_sql, tuple(params))
-    rows = await c.fetchall()
-    await conn.close()
-    return [dict(row) for row in rows]
+    return "SELECT * FROM facilities LIMIT ?", (limit,)
 
-async def query_facilities(
-    province: Optional[str] = None,
-    city: Optional[str] = None,
-    facility_type: Optional[str] = None,
-    limit: int = 20
-) -> List[Dict[str, Any]]:
-    MUSEUM_ALIASES = [
-        "museum",
-        "gallery",
-        "art or cultural centre",
-        "heritage or historic site",
-        "library or archives",
-        "miscellaneous"
-    ]
-
-    PROVINCE_MAP = {
-        "british columbia": "bc",
-        "bc": "bc",
-        "ontario": "on",
-        "on": "on",
-        "quebec": "qc",
-        "québec": "qc",
-        "qc": "qc",
-        "alberta": "ab",
-        "ab": "ab",
-        "manitoba": "mb",
-        "mb": "mb",
-        "saskatchewan": "sk",
-        "sk": "sk",
-        "nova scotia": "ns",
-        "ns": "ns",
-        "new brunswick": "nb",
-        "nb": "nb",
-        "newfoundland": "nl",
-        "nl": "nl",
-        "prince edward island": "pe",
-        "pei": "pe",
-        "pe": "pe",
-        "yukon": "yt",
-        "yt": "yt",
-        "nunavut": "nu",
-        "nu": "nu",
-        "northwest territories": "nt",
-        "nt": "nt"
-    }
+@redis_cached
+async def search_facilities(query_text: str, limit: int = 20) -> List[Dict[str, Any]]:
+    sql, params = _build_search_sql(query_text, limit)
+    async with pool.read() as conn:
+        return await _fetch_dicts(conn, sql, params)
+
+def _build_query_sql(
+    province: Optional[str],
+    city: Optional[str],
+    facility_type: Optional[str],
+    limit: int
+) -> tuple:
+    # SQLite treats a negative LIMIT as unlimited.
+    limit = max(limit, 0)
 
     if city:
-        nc = normalize_text(city)
-        orig = nc
-
-        city = nc[:4]
-
-        if orig == "montreal" and province is None:
+        if normalize_text(city) == "montreal" and province is None:
             province = "Quebec"
 
-
-    conn = await get_db_connection()
-    c = await conn.cursor()
-
     sql = "SELECT * FROM facilities WHERE 1=1"
     params = []
 
     if province:
         p = normalize_text(province)
         mapped = PROVINCE_MAP.get(p, p)
-        sql += " AND LOWER(Prov_Terr) = ?"
+        sql += " AND prov_terr_norm = ?"
         params.append(mapped)
 
     if city:
         norm_city = normalize_text(city)
-        like_city = f"%{norm_city}%"
-        sql += """
-            AND (
-                LOWER(REPLACE(REPLACE(REPLACE(City, '-', ' '), '.', ' '), '''', ' ')) LIKE ?
-                OR LOWER(REPLACE(REPLACE(REPLACE(CSD_Name, '-', ' '), '.', ' '), '''', ' ')) LIKE ?
-                OR LOWER(REPLACE(REPLACE(REPLACE(Provider, '-', ' '), '.', ' '), '''', ' ')) LIKE ?
-            )
-        """
-        params.extend([like_city, like_city, like_city])
+        # Punctuation-only values normalize to "", which has no prefix
+        # range; treat that as no city filter, matching the substring
+        # semantics where an empty needle matches everything.
+        if norm_city:
+            lower, upper = prefix_range(norm_city)
+            sql += " AND city_norm >= ? AND city_norm < ?"
+            params.extend([lower, upper])
 
     if facility_type:
         norm_type = normalize_text(facility_type)
         if norm_type == "museum":
-            alias_norm = [normalize_text(x) for x in MUSEUM_ALIASES]
+            alias_norm = sorted(_MUSEUM_ALIASES_NORM)
             placeholders = ",".join(["?"] * len(alias_norm))
-            sql += f" AND LOWER(ODCAF_Facility_Type) IN ({placeholders})"
+            sql += f" AND type_norm IN ({placeholders})"
             params.extend(alias_norm)
         else:
-            sql += " AND LOWER(ODCAF_Facility_Type) LIKE ?"
-            params.append(f"%{norm_type}%")
+            sql += " AND type_norm GLOB ?"
+            params.append(f"*{norm_type}*")
 
-    prelimit = 5000 if facility_type else 1000
     sql += " LIMIT ?"
-    params.append(prelimit)
-
-    await c.execute(sql, tuple(params))
-    rows = await c.fetchall()
-    await conn.close()
+    params.append(limit)
 
-    results = []
-    for row in rows:
-        results.append(dict(row))
-        if len(results) >= limit:
-            break
+    return sql, tuple(params)
 
-    return results
+@redis_cached
+async def query_facilities(
+    province: Optional[str] = None,
+    city: Optional[str] = None,
+    facility_type: Optional[str] = None,
+    limit: int = 20
+) -> List[Dict[str, Any]]:
+    sql, params = _build_query_sql(province, city, facility_type, limit)
+    async with pool.read() as conn:
+        return await _fetch_dicts(conn, sql, params)
+
+async def _iter_rows(sql: str, params):
+    async with pool.read() as conn:
+        async with conn.execute(sql, params) as cursor:
+            columns = [d[0] for d in cursor.description]
+            async for row in cursor:
+                yield dict(zip(columns, row))
+
+async def iter_search_facilities(query_text: str, limit: int = 20):
+    """Yield search results row by row without materializing the full list."""
+    sql, params = _build_search_sql(query_text, limit)
+    async for row in _iter_rows(sql, params):
+        yield row
+
+async def iter_query_facilities(
+    province: Optional[str] = None,
+    city: Optional[str] = None,
+    facility_type: Optional[str] = None,
+    limit: int = 20
+):
+    """Yield query results row by row without materializing the full list."""
+    sql, params = _build_query_sql(province, city, facility_type, limit)
+    async for row in _iter_rows(sql, params):
+        yield row
 
 
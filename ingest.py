@@ -1,28 +1,149 @@
 import pandas as pd
-from sqlalchemy import create_engine
+import re
+import sqlite3
 import os
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+    pacsv = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
 CSV_FILE = 'ODCAF_v1.0.csv'
 DB_FILE = 'odcaf.db'
 TABLE_NAME = 'facilities'
 
+NORM_COLUMNS = {
+    'facility_name': 'facility_name_norm',
+    'city': 'city_norm',
+    'odcaf_facility_type': 'type_norm',
+    'prov_terr': 'prov_terr_norm',
+}
+
+INGEST_PRAGMAS = """
+    PRAGMA journal_mode=OFF;
+    PRAGMA synchronous=OFF;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA locking_mode=EXCLUSIVE;
+"""
+
+SQL_TYPES = {'i': 'INTEGER', 'u': 'INTEGER', 'f': 'REAL'}
+
+_col_re = re.compile(r'[^a-z0-9]+')
+
+# Combining-mark ranges (Unicode category Mn for Latin text). Stripping
+# just these after NFD matches database.normalize_text, which keeps
+# non-decomposable characters like "œ" — a bare ascii-encode would drop
+# them and make the stored norm columns diverge from the runtime
+# normalizer.
+_COMBINING_RE = (
+    '[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]'
+)
+
+
+def normalize_series(s: pd.Series) -> pd.Series:
+    """Vectorized equivalent of database.normalize_text for a whole column."""
+    return (
+        s.fillna('')
+        .str.lower()
+        .str.normalize('NFD')
+        .str.replace(_COMBINING_RE, '', regex=True)
+        .str.replace(r"[-.']", ' ', regex=True)
+        .str.replace(r'\s+', ' ', regex=True)
+        .str.strip()
+    )
+
+
+def read_csv() -> pd.DataFrame:
+    """Parse the CSV, multi-threaded via pyarrow when it is installed."""
+    if pacsv is not None:
+        for encoding in ('utf-8', 'latin1'):
+            try:
+                table = pacsv.read_csv(
+                    CSV_FILE,
+                    read_options=pacsv.ReadOptions(block_size=16 << 20, encoding=encoding),
+                )
+            except ValueError:
+                print(f"{encoding} failed, retrying...")
+                continue
+            # Arrow types undecodable columns as binary instead of erroring,
+            # so treat any binary column as a wrong-encoding signal.
+            if any(pa.types.is_binary(field.type) for field in table.schema):
+                print(f"{encoding} failed, retrying...")
+                continue
+            return table.to_pandas()
+    try:
+        return pd.read_csv(CSV_FILE, encoding='utf-8')
+    except UnicodeDecodeError:
+        print("UTF-8 failed, trying latin1...")
+        return pd.read_csv(CSV_FILE, encoding='latin1')
+
 
 def ingest_data():
     if not os.path.exists(CSV_FILE):
         print(f"Error: {CSV_FILE} not found.")
         return
 
-    try:
-        df = pd.read_csv(CSV_FILE, encoding='utf-8')
-    except UnicodeDecodeError:
-        print("UTF-8 failed, trying latin1...")
-        df = pd.read_csv(CSV_FILE, encoding='latin1')
+    df = read_csv()
+
+    df.columns = [_col_re.sub('_', c.strip().lower()).strip('_') for c in df.columns]
+
+    for source, norm in NORM_COLUMNS.items():
+        df[norm] = normalize_series(df[source])
+
+    conn = sqlite3.connect(DB_FILE)
+    conn.executescript(INGEST_PRAGMAS)
+
+    columns = ', '.join(
+        f'"{name}" {SQL_TYPES.get(df[name].dtype.kind, "TEXT")}' for name in df.columns
+    )
+    conn.execute(f"DROP TABLE IF EXISTS {TABLE_NAME}_fts")
+    conn.execute(f"DROP TABLE IF EXISTS {TABLE_NAME}")
+    conn.execute(f"CREATE TABLE {TABLE_NAME} ({columns})")
+
+    placeholders = ','.join('?' * len(df.columns))
+    conn.execute("BEGIN")
+    conn.executemany(
+        f"INSERT INTO {TABLE_NAME} VALUES ({placeholders})",
+        df.itertuples(index=False, name=None),
+    )
+    conn.commit()
+
+    # Indexes are built after the bulk insert: one pass over the full table
+    # is cheaper than maintaining each index per row.
+    for norm in NORM_COLUMNS.values():
+        conn.execute(f"CREATE INDEX idx_{norm} ON {TABLE_NAME}({norm})")
 
-    df.columns = df.columns.str.strip().str.lower().str.replace('[^a-z0-9_]', '', regex=True).str.replace(' ', '_')
+    # Compound index matching the filter order in query_facilities, so a
+    # province+city+type query seeks once instead of picking one single-
+    # column index and scanning the rest.
+    conn.execute(
+        f"CREATE INDEX idx_prov_city_type ON {TABLE_NAME}"
+        "(prov_terr_norm, city_norm, type_norm)"
+    )
 
-    engine = create_engine(f'sqlite:///{DB_FILE}')
+    conn.execute(
+        f"CREATE VIRTUAL TABLE {TABLE_NAME}_fts USING fts5("
+        "facility_name, odcaf_facility_type, city, prov_terr, "
+        f"content='{TABLE_NAME}', content_rowid='rowid', tokenize='trigram')"
+    )
+    conn.execute(f"INSERT INTO {TABLE_NAME}_fts({TABLE_NAME}_fts) VALUES('rebuild')")
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
 
-    df.to_sql(TABLE_NAME, engine, if_exists='replace', index=False, chunksize=1000)
+    redis_url = os.environ.get("REDIS_URL")
+    if redis and redis_url:
+        try:
+            redis.from_url(redis_url).incr("odcaf:gen")
+        except Exception as exc:
+            print(f"Warning: could not bump Redis cache generation: {exc}")
 
     print(f"Data ingested into {DB_FILE} in table {TABLE_NAME}")
     print("Available columns after sanitizing:")
@@ -30,4 +151,4 @@ def ingest_data():
 
 
 if __name__ == "__main__":
-    ingest_data()
\ No newline at end of file
+    ingest_data()